@@ -1,25 +1,24 @@
+import asyncio
 import sys
 
 from langchain_tavily import TavilySearch
 from langchain_openai import ChatOpenAI
 
-from .utils import PURPLE, bold, BLUE
+from .utils import PURPLE, bold, BLUE, ainput
 from .agent import Agent
+from .prompts import RESEARCH_PROMPT
+from .search import PooledTavilySearchAPIWrapper
 
 def main():
 
-    tool = TavilySearch(max_results=4)
+    tool = TavilySearch(max_results=4, api_wrapper=PooledTavilySearchAPIWrapper())
 
-    prompt = """
-        Eres un asistente de investigación inteligente. Utiliza el motor de búsqueda para buscar información. \
-        Se te permite hacer múltiples llamadas (ya sea juntas o en secuencia). \
-        Solo busca información cuando estés seguro de lo que quieres. \
-        Si necesitas buscar alguna información antes de hacer una pregunta de seguimiento, se te permite hacerlo.
-        Da respuestas breves, no te extiendas demasiado.
-    """.strip()
+    # Con --prefetch se anticipan las respuestas a posibles preguntas de seguimiento (multiplica las llamadas a las APIs)
+    prefetch_model = ChatOpenAI(model="gpt-4o-mini") if "--prefetch" in sys.argv[1:] else None
 
     model = ChatOpenAI(model="gpt-4o")
-    agent = Agent(model, [tool], system=prompt, verbose=False)
+    # La caché semántica solo sirve para la primera pregunta de cada agente, y aquí hay un único agente por sesión
+    agent = Agent(model, [tool], system=RESEARCH_PROMPT, verbose=False, cache=False, prefetch_model=prefetch_model)
 
     # Imprime el grafo si se pasa el argumento --print-graph en formato Mermaid
     if len(sys.argv) > 1:
@@ -29,12 +28,25 @@ def main():
             return
 
     print(f"\n{bold("🤖 Wiseguy:", PURPLE)} ¡Hola! Soy Wiseguy, tu asistente de investigación. ¿En qué puedo ayudarte hoy?\n")
-    while True:
-        user_input = input(f"{bold('🧑‍🦲 Tú:', BLUE)} ")
-        if user_input.strip().lower() == "":
-            break
-        agent.ask(user_input)
-        print("\n")
+    # Un único event loop para toda la sesión, en lugar de crear uno nuevo por pregunta
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    prefetch = None
+    try:
+        while True:
+            user_input = loop.run_until_complete(ainput(f"{bold('🧑‍🦲 Tú:', BLUE)} "))
+            # Las respuestas anticipadas que aún no han terminado ya no se necesitan
+            if prefetch is not None:
+                prefetch.cancel()
+                loop.run_until_complete(asyncio.gather(prefetch, return_exceptions=True))
+            if user_input.strip().lower() == "":
+                break
+            answer = agent.ask(user_input, loop=loop)
+            print("\n")
+            # Mientras el usuario escribe, se anticipan las respuestas a posibles preguntas de seguimiento
+            prefetch = loop.create_task(agent.prefetch(answer))
+    finally:
+        loop.close()
 
 if __name__ == "__main__":
     main()
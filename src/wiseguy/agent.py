@@ -1,24 +1,269 @@
 import asyncio
+import functools
+import logging
 import operator
-from typing import TypedDict, Annotated, Iterator
-
+import re
+import sys
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING, TypedDict, Annotated, Iterator
+
+import numpy as np
+import orjson
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import InMemorySaver
 
+from .prompts import FOLLOW_UP_PROMPT
 from .utils import bold, PURPLE
 
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
 class AgentState(TypedDict):
     """Estado del agente usado por el grafo.
 
     Contiene la lista de mensajes intercambiados durante la conversación.
 
     - messages: lista acumulativa de mensajes; se combina usando ``operator.add``.
+
+    El reductor debe devolver una lista nueva: LangGraph guarda los checkpoints en segundo
+    plano mientras se ejecuta el siguiente paso y comparte la lista entre copias del canal,
+    por lo que ampliarla en el sitio (``list.extend``) corrompe el historial.
     """
 
     messages: Annotated[list[AnyMessage], operator.add]  # Crea una lista de mensajes que se puede concatenar con el operador +
 
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"   # Modelo local de ``sentence-transformers`` usado por la caché semántica
+STREAM_FLUSH_INTERVAL = 0.032          # Segundos entre volcados de stdout al imprimir la respuesta en streaming
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")   # Marcador de lista al comienzo de una línea
+
+
+@functools.cache
+def _encoder() -> "SentenceTransformer":
+    """Carga (una única vez) el modelo de embeddings.
+
+    ``sentence_transformers`` se importa aquí y no al principio del módulo porque su importación
+    (``torch`` incluido) tarda varios segundos, que no hay que pagar si la caché no se usa.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+@functools.lru_cache(maxsize=1024)
+def _embed(text: str) -> bytes:
+    """Calcula el embedding normalizado de un texto.
+
+    Se devuelven los bytes del vector para que el resultado sea inmutable y pueda
+    cachearse: las preguntas repetidas no vuelven a pasar por el modelo.
+    """
+    return _encoder().encode(text, normalize_embeddings=True).tobytes()
+
+
+class SemanticCache:
+    """Caché semántica de respuestas indexada por el embedding de la pregunta.
+
+    Si una pregunta es lo bastante parecida (similitud coseno) a otra ya respondida,
+    se reutiliza la respuesta almacenada en lugar de volver a ejecutar el grafo.
+    Las entradas se desalojan siguiendo una política LRU.
+
+    Los embeddings se guardan como filas de una única matriz contigua, de modo que
+    comparar una pregunta con todas las almacenadas es un solo producto matriz-vector.
+
+    Atributos:
+        threshold: similitud mínima para considerar que dos preguntas son equivalentes.
+        maxsize: número máximo de respuestas almacenadas.
+    """
+
+    GROWTH = 256    # Filas que se añaden a la matriz de embeddings cada vez que se llena
+
+    def __init__(self, threshold: float = 0.87, maxsize: int = 512):
+        """Inicializa una caché vacía.
+
+        Parámetros:
+            threshold: similitud coseno mínima para devolver una respuesta almacenada.
+            maxsize: número máximo de entradas antes de desalojar la menos usada.
+        """
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._mat: np.ndarray|None = None                   # Embeddings normalizados, una fila por entrada
+        self._n = 0                                         # Filas ocupadas de ``_mat``
+        self._questions: list[str] = []                     # Pregunta de cada fila
+        self._responses: list[AnyMessage] = []              # Respuesta de cada fila
+        self._rows: OrderedDict[str, int] = OrderedDict()   # Fila de cada pregunta, de la menos a la más usada
+
+    def lookup(self, question: str) -> AnyMessage|None:
+        """Busca la respuesta almacenada para la pregunta más parecida.
+
+        Parámetros:
+            question: texto de la consulta del usuario.
+
+        Devuelve:
+            La respuesta almacenada si supera el umbral de similitud; en caso contrario ``None``.
+        """
+        if not self._n:
+            return None
+        embedding = np.frombuffer(_embed(question), dtype=np.float32)
+        sims = self._mat[:self._n] @ embedding             # Al estar normalizados, el producto escalar es la similitud coseno
+        best = int(sims.argmax())
+        if sims[best] < self.threshold:
+            return None
+        self._rows.move_to_end(self._questions[best])
+        return self._responses[best]
+
+    def store(self, question: str, answer: AnyMessage) -> None:
+        """Almacena la respuesta a una pregunta, desalojando la entrada menos usada si es necesario."""
+        embedding = np.frombuffer(_embed(question), dtype=np.float32)
+        row = self._rows.get(question)
+        if row is None:
+            if self._n < self.maxsize:
+                row = self._append_row(embedding.shape[0])
+            else:
+                # La fila de la entrada menos usada se reutiliza para la nueva
+                _, row = self._rows.popitem(last=False)
+            self._rows[question] = row
+            self._questions[row] = question
+        else:
+            self._rows.move_to_end(question)
+        self._mat[row] = embedding
+        self._responses[row] = answer
+
+    def _append_row(self, dim: int) -> int:
+        """Reserva una fila nueva al final de la matriz, ampliándola si está llena."""
+        if self._mat is None:
+            self._mat = np.zeros((min(self.GROWTH, self.maxsize), dim), dtype=np.float32)
+        elif self._n == self._mat.shape[0]:
+            extra = np.zeros((min(self.GROWTH, self.maxsize - self._n), dim), dtype=np.float32)
+            self._mat = np.concatenate((self._mat, extra))
+        self._questions.append(None)
+        self._responses.append(None)
+        self._n += 1
+        return self._n - 1
+
+
+def _to_text(result) -> str:
+    """Convierte el resultado de una herramienta en el texto que recibe el modelo.
+
+    Los resultados estructurados (por ejemplo, el ``dict`` de Tavily) se serializan como
+    JSON compacto; si no son serializables se recurre a ``str``.
+    """
+    if isinstance(result, str):
+        return result
+    try:
+        return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        return str(result)
+
+
+_SHARED_CACHES: OrderedDict[tuple, tuple] = OrderedDict()   # Cachés semánticas comunes, de la menos a la más usada
+_SHARED_CACHES_MAXSIZE = 8
+
+
+def _shared_cache(model, tools, system: str) -> SemanticCache:
+    """Devuelve la caché semántica común a los agentes con el mismo modelo, herramientas y prompt de sistema.
+
+    Solo se guardan respuestas a la primera pregunta de cada conversación, que no dependen
+    del contexto, así que pueden compartirse entre conversaciones (y agentes) distintos. Sí
+    dependen del modelo, de las herramientas y del prompt de sistema, que forman la clave;
+    como en ``_bind_tools``, el modelo y las herramientas se identifican por su ``id``.
+    """
+    key = (id(model), *map(id, tools), system)
+    entry = _SHARED_CACHES.get(key)
+    if entry is None:
+        # Se guardan también el modelo y las herramientas para que sus ``id`` no se reutilicen mientras estén en la caché
+        entry = _SHARED_CACHES[key] = (model, tuple(tools), SemanticCache())
+        if len(_SHARED_CACHES) > _SHARED_CACHES_MAXSIZE:
+            _SHARED_CACHES.popitem(last=False)
+    else:
+        _SHARED_CACHES.move_to_end(key)
+    return entry[2]
+
+
+_CHECKPOINTER = InMemorySaver()     # Checkpointer común a todos los agentes; cada agente usa su propio ``thread_id``
+
+
+def _node(name: str):
+    """Crea la función de un nodo que delega en el método ``name`` del agente en ejecución.
+
+    El agente se obtiene de ``config["configurable"]["agent"]``, de modo que el mismo grafo
+    compilado sirve para cualquier instancia de ``Agent``.
+    """
+    def node(state: AgentState, config: RunnableConfig):
+        return getattr(config["configurable"]["agent"], name)(state)
+    node.__name__ = name
+    return node
+
+
+def _anode(name: str):
+    """Versión asíncrona de ``_node`` para métodos ``async`` del agente."""
+    async def node(state: AgentState, config: RunnableConfig):
+        return await getattr(config["configurable"]["agent"], name)(state)
+    node.__name__ = name
+    return node
+
+
+_BOUND_MODELS: OrderedDict[tuple[int, ...], tuple] = OrderedDict()   # Modelos con herramientas enlazadas, del menos al más usado
+_BOUND_MODELS_MAXSIZE = 4
+
+
+def _bind_tools(model, tools):
+    """Devuelve ``model.bind_tools(tools)`` reutilizando el resultado para el mismo modelo y herramientas.
+
+    ``bind_tools`` genera el esquema JSON de cada herramienta; al cachearlo, crear varios agentes
+    con el mismo modelo y herramientas (por ejemplo, con distinto prompt de sistema) no repite ese
+    trabajo. La clave es la identidad de los objetos, de modo que otro modelo u otra lista de
+    herramientas produce un enlace nuevo.
+    """
+    key = (id(model), *map(id, tools))
+    entry = _BOUND_MODELS.get(key)
+    if entry is None:
+        # Se guardan también el modelo y las herramientas para que sus ``id`` no se reutilicen mientras estén en la caché
+        entry = _BOUND_MODELS[key] = (model, tuple(tools), model.bind_tools(tools))
+        if len(_BOUND_MODELS) > _BOUND_MODELS_MAXSIZE:
+            _BOUND_MODELS.popitem(last=False)
+    else:
+        _BOUND_MODELS.move_to_end(key)
+    return entry[2]
+
+
+@functools.cache
+def _build_graph():
+    """Construye y compila el grafo del agente una única vez por proceso.
+
+    Devuelve:
+        El grafo compilado, compartido por todas las instancias de ``Agent``.
+    """
+    graph = StateGraph(AgentState)
+
+    # Definición de nodos del grafo
+    graph.add_node("init", _node("init_state"))                                                    # Nodo de estado inicial
+    graph.add_node("llm", RunnableLambda(_node("call_openai"), afunc=_anode("acall_openai")))      # Nodo de llamada al modelo, con versión síncrona y asíncrona
+    graph.add_node("action", RunnableLambda(_node("take_action"), afunc=_anode("atake_action")))   # Nodo de ejecución de herramientas (acciones), con versión síncrona y asíncrona
+
+    # Definición de aristas del grafo
+    graph.add_edge("init", "llm")                           # Desde el estado inicial, ir al modelo
+    graph.add_conditional_edges(
+        "llm",                                              # La arista condicional sale del nodo "llm"
+        _node("exists_action"),                             # Función que decide si se debe ir al nodo de acción o terminar
+        {True: "action", False: END},
+    )                                                       # Si el modelo decide llamar a una herramienta, ir al nodo de acción; si no, terminar
+    graph.add_edge("action", "llm")                         # Después de ejecutar una acción, volver al modelo
+
+    # Definición del punto de entrada del grafo
+    graph.set_entry_point("init")
+
+    # Compilación del grafo para su ejecución
+    return graph.compile(checkpointer=_CHECKPOINTER)
+
+
 class Agent:
     """Agente orquestador que combina un modelo LLM con herramientas.
 
@@ -30,64 +275,82 @@ class Agent:
 
     Atributos:
         system: texto del mensaje de sistema que se añadirá una vez al principio.
-        graph: grafo compilado de LangGraph que gestiona el flujo de mensajes.
+        graph: grafo compilado de LangGraph que gestiona el flujo de mensajes (común a todos los agentes).
         tools: diccionario de herramientas disponibles indexadas por nombre.
         model: modelo LLM con herramientas enlazadas mediante ``bind_tools``.
+        cache: caché semántica de respuestas (común a los agentes con el mismo modelo, herramientas y prompt de sistema) o ``None`` si está desactivada.
+        history_window: número máximo de mensajes recientes que se envían al modelo.
+        max_tool_chars: longitud máxima del resultado de una herramienta que se guarda en el historial.
+        prefetch_model: modelo usado para anticipar preguntas de seguimiento o ``None`` si está desactivado.
     """
 
-    _current_state: AgentState = None
-
-    def __init__(self, model, tools, system: str = "", verbose: bool = False):
+    def __init__(self, model, tools, system: str = "", verbose: bool = False, cache: bool = True,
+                 history_window: int = 20, max_tool_chars: int = 4000, prefetch_model=None):
         """Inicializa el agente con un modelo, herramientas y un prompt de sistema.
 
         Parámetros:
             model: instancia del modelo conversacional (por ejemplo, ``ChatOpenAI``).
             tools: lista de herramientas compatibles con LangChain a exponer al modelo.
             system: mensaje de sistema opcional que se antepone solo una vez.
+            cache: si es ``True``, reutiliza las respuestas a preguntas semánticamente equivalentes
+                hechas al comienzo de una conversación por cualquier agente con el mismo modelo,
+                herramientas y prompt de sistema.
+            history_window: número máximo de mensajes recientes (además del de sistema) que se envían al modelo.
+            max_tool_chars: número máximo de caracteres del resultado de cada herramienta.
+            prefetch_model: modelo (normalmente uno barato, como ``gpt-4o-mini``) con el que ``prefetch``
+                propone preguntas de seguimiento.
         """
         self.system = system
         self.verbose = verbose
+        self.cache = _shared_cache(model, tools, system) if cache else None
+        self.history_window = history_window
+        self.max_tool_chars = max_tool_chars
+        self.prefetch_model = prefetch_model
+        self._prefetched: tuple[str, SemanticCache]|None = None    # Respuestas anticipadas e id de la respuesta a la que siguen
+        thread_id = uuid.uuid4().hex
         self.config = {
             "recursion_limit": 50,                              # Límite de recursión para evitar bucles infinitos en el grafo (para que no esté infinitamente dando vueltas)
-            "configurable": { "thread_id" : "1"}                # Identificador del hilo de conversación (en este caso, 1 agente sólo puede mantener una conversación a la vez)
+            "configurable": {
+                "thread_id": thread_id,                         # Identificador del hilo de conversación (1 agente sólo puede mantener una conversación a la vez)
+                "agent": self,                                  # Agente que ejecutan los nodos del grafo compartido
+            },
         }
 
-        graph = StateGraph(AgentState)
-
-        # Definición de nodos del grafo
-        graph.add_node("init", self.init_state)                 # Nodo de estado inicial
-        graph.add_node("llm", self.call_openai)                 # Nodo de llamada al modelo
-        graph.add_node("action", self.take_action)              # Nodo de ejecución de herramientas (acciones)
-
-        # Definición de aristas del grafo
-        graph.add_edge("init", "llm")                           # Desde el estado inicial, ir al modelo        
-        graph.add_conditional_edges(
-            "llm",                                              # La arista condicional sale del nodo "llm"
-            self.exists_action,                                 # Función que decide si se debe ir al nodo de acción o terminar
-            {True: "action", False: END},
-        )                                                       # Si el modelo decide llamar a una herramienta, ir al nodo de acción; si no, terminar
-        graph.add_edge("action", "llm")                         # Después de ejecutar una acción, volver al modelo
-
-        # Definición del punto de entrada del grafo
-        graph.set_entry_point("init")
+        # El grafo compilado se comparte entre todos los agentes
+        self.graph = _build_graph()
 
-        # Compilación del grafo para su ejecución
-        self.graph = graph.compile(checkpointer=InMemorySaver())
+        # Al destruir el agente se libera su historial del checkpointer compartido
+        weakref.finalize(self, _CHECKPOINTER.delete_thread, thread_id)
 
         # Mapeo de herramientas por nombre
         self.tools = {t.name: t for t in tools}
 
-        # Asociar las herramientas al modelo
-        self.model = model.bind_tools(tools)
+        # Asociar las herramientas al modelo (reutilizando el enlace si otro agente ya lo ha creado)
+        self.model = _bind_tools(model, tools)
+
+    @property
+    def current_state(self) -> AgentState:
+        """Estado actual de la conversación, leído bajo demanda del checkpointer.
+
+        Cada acceso recupera el checkpoint con todo el historial, así que conviene leerlo una vez y reutilizarlo.
+        """
+        return self.graph.get_state(self.config).values
 
     def init_state(self, state: AgentState) -> AgentState:
-        """Crea el estado inicial del agente con el mensaje de sistema.
+        """Añade el mensaje de sistema al estado de la conversación.
+
+        El nodo se ejecuta con cada pregunta, pero el mensaje de sistema solo se añade
+        la primera vez: después ya forma parte del historial guardado por el checkpointer.
+
+        Parámetros:
+            state: estado actual con el historial de mensajes.
 
         Devuelve:
-            Un estado inicial con el mensaje de sistema si está configurado.
+            Un estado con el mensaje de sistema si está configurado y aún no se ha añadido.
         """
-        self._current_state = {"messages": [SystemMessage(content=self.system) if self.system else []]}
-        return self._current_state
+        if self.system and not any(isinstance(m, SystemMessage) for m in state["messages"]):
+            return {"messages": [SystemMessage(content=self.system)]}
+        return {"messages": []}
     
     def exists_action(self, state: AgentState) -> bool:
         """Indica si el último mensaje contiene llamadas a herramientas.
@@ -98,14 +361,15 @@ class Agent:
         Devuelve:
             ``True`` si el último mensaje del modelo incluye ``tool_calls``; en caso contrario ``False``.
         """
-        self._current_state = state
-        result = state["messages"][-1]          # Último mensaje generado por el modelo
-        return len(result.tool_calls) > 0       # Devuelve True si hay llamadas a herramientas en el último mensaje
+        # Devuelve True si hay llamadas a herramientas en el último mensaje generado por el modelo.
+        # Se convierte a bool porque el valor se usa como clave del mapa {True: "action", False: END}
+        return bool(state["messages"][-1].tool_calls)
 
     def call_openai(self, state: AgentState) -> AgentState:
         """Invoca el modelo LLM con el historial de mensajes.
 
-        Inserta el mensaje de sistema una única vez si está configurado.
+        Solo se envían los ``history_window`` mensajes más recientes, junto con el mensaje
+        de sistema, para que el coste de cada llamada no crezca con la conversación.
 
         Parámetros:
             state: estado actual con los mensajes acumulados.
@@ -113,80 +377,279 @@ class Agent:
         Devuelve:
             Un nuevo estado con el mensaje de salida del modelo en ``messages``.
         """
-        self._current_state = state
-        messages = state["messages"]
+        messages = self.__trim_history(state["messages"])
         message = self.model.invoke(messages)
         if self.verbose:
             message.pretty_print()
         return {"messages": [message]}
 
+    async def acall_openai(self, state: AgentState) -> AgentState:
+        """Versión asíncrona de ``call_openai``.
+
+        La respuesta se sigue emitiendo token a token a través de ``astream_events``
+        sin bloquear un hilo del executor mientras se espera al modelo.
+
+        Parámetros:
+            state: estado actual con los mensajes acumulados.
+
+        Devuelve:
+            Un nuevo estado con el mensaje de salida del modelo en ``messages``.
+        """
+        messages = self.__trim_history(state["messages"])
+        message = await self.model.ainvoke(messages)
+        if self.verbose:
+            message.pretty_print()
+        return {"messages": [message]}
+
+    def __trim_history(self, messages: list[AnyMessage]) -> list[AnyMessage]:
+        """Recorta el historial a los ``history_window`` mensajes más recientes conservando el de sistema.
+
+        El corte se ajusta a los turnos: nunca deja fuera la última pregunta del usuario
+        (aunque el turno actual supere la ventana) ni separa los ``ToolMessage`` del
+        ``AIMessage`` que los solicitó.
+
+        Parámetros:
+            messages: historial completo de la conversación.
+
+        Devuelve:
+            La lista de mensajes que se envía al modelo.
+        """
+        if len(messages) <= self.history_window:
+            return messages
+        start = len(messages) - self.history_window
+        # La ventana siempre incluye la última pregunta del usuario
+        last_human = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), start)
+        start = min(start, last_human)
+        # Un ToolMessage sin el AIMessage que lo solicitó es rechazado por OpenAI: la ventana empieza en ese AIMessage
+        while start > 0 and isinstance(messages[start], ToolMessage):
+            start -= 1
+        system = next((m for m in messages[:start] if isinstance(m, SystemMessage)), None)
+        return messages[start:] if system is None else [system] + messages[start:]
+
     def take_action(self, state: AgentState) -> AgentState:
         """Ejecuta las herramientas solicitadas por el modelo y retorna sus resultados.
 
+        Las llamadas son independientes entre sí, por lo que se ejecutan en paralelo
+        en un pool de hilos (las búsquedas son operaciones de red). El pool propaga el
+        contexto de la ejecución a cada hilo para que se sigan emitiendo los callbacks
+        y trazas de las herramientas.
+
         Parámetros:
             state: estado actual cuyo último mensaje contiene ``tool_calls``.
 
         Devuelve:
             Un estado con los mensajes de tipo ``ToolMessage`` correspondientes a cada ejecución.
         """
-        self._current_state = state
         tool_calls = state["messages"][-1].tool_calls
-        results = []
-        for t in tool_calls:
+        with ContextThreadPoolExecutor(max_workers=len(tool_calls)) as executor:
+            results = list(executor.map(self.__run_tool, tool_calls))
+        return {"messages": [self.__tool_message(t, result) for t, result in zip(tool_calls, results)]}
+
+    async def atake_action(self, state: AgentState) -> AgentState:
+        """Versión asíncrona de ``take_action``: ejecuta las herramientas de forma concurrente.
+
+        Parámetros:
+            state: estado actual cuyo último mensaje contiene ``tool_calls``.
+
+        Devuelve:
+            Un estado con los mensajes de tipo ``ToolMessage`` correspondientes a cada ejecución.
+        """
+        tool_calls = state["messages"][-1].tool_calls
+        results = await asyncio.gather(*(self.__arun_tool(t) for t in tool_calls))
+        return {"messages": [self.__tool_message(t, result) for t, result in zip(tool_calls, results)]}
+
+    def __run_tool(self, t: dict):
+        """Ejecuta una llamada a herramienta y devuelve su resultado."""
+        if self.verbose:
+            print(f"\nEjecutando acción: {t}\n")
+        tool = self.tools.get(t["name"])
+        if tool is None:  # check for bad tool name from LLM
             if self.verbose:
-                print(f"\nEjecutando acción: {t}\n")
-            if not t["name"] in self.tools:  # check for bad tool name from LLM
-                if self.verbose:
-                    print("\n ....nombre de tool no válida....")
-                result = "nombre de tool no válida, reintentar"  # instruir al LLM a reintentar si el nombre es incorrecto
-            else:
-                result = self.tools[t["name"]].invoke(t["args"])
-            message = ToolMessage(tool_call_id=t["id"], name=t["name"], content=str(result))
+                print("\n ....nombre de tool no válida....")
+            return "nombre de tool no válida, reintentar"  # instruir al LLM a reintentar si el nombre es incorrecto
+        return tool.invoke(t["args"])
+
+    async def __arun_tool(self, t: dict):
+        """Ejecuta de forma asíncrona una llamada a herramienta y devuelve su resultado."""
+        if self.verbose:
+            print(f"\nEjecutando acción: {t}\n")
+        tool = self.tools.get(t["name"])
+        if tool is None:  # check for bad tool name from LLM
             if self.verbose:
-                message.pretty_print()
-            results.append(message)
-        return {"messages": results}
+                print("\n ....nombre de tool no válida....")
+            return "nombre de tool no válida, reintentar"  # instruir al LLM a reintentar si el nombre es incorrecto
+        return await tool.ainvoke(t["args"])
 
-    def ask(self, question: str, sync: bool = False) -> AnyMessage|None:
+    def __tool_message(self, t: dict, result) -> ToolMessage:
+        """Construye el ``ToolMessage`` con el resultado de una llamada a herramienta."""
+        message = ToolMessage(tool_call_id=t["id"], name=t["name"], content=_to_text(result)[:self.max_tool_chars])
+        if self.verbose:
+            message.pretty_print()
+        return message
+
+    def ask(self, question: str, sync: bool = False, loop: asyncio.AbstractEventLoop|None = None) -> AnyMessage|None:
         """Formula una pregunta al agente y devuelve la última respuesta.
 
+        Si la caché semántica está activa y contiene una pregunta equivalente, se devuelve
+        la respuesta almacenada sin ejecutar el grafo. La caché solo se usa para la primera
+        pregunta de la conversación: las siguientes pueden depender del contexto (por ejemplo,
+        "¿Y su población?") y la misma pregunta no tendría la misma respuesta.
+
         Parámetros:
             question: texto de la consulta del usuario.
+            sync: si es ``True``, ejecuta el grafo de forma síncrona sin imprimir la respuesta.
+            loop: event loop en el que ejecutar el grafo en modo asíncrono. Permite reutilizar el
+                mismo loop entre preguntas; si no se indica, se crea uno nuevo con ``asyncio.run``.
 
         Devuelve:
-            El último mensaje generado por el agente en respuesta a la consulta o ``None`` si no hay respuesta o es asíncrono.
+            El último mensaje generado por el agente en respuesta a la consulta o ``None`` si no hay respuesta.
         """
         message = HumanMessage(content=question)
         if self.verbose:
             message.pretty_print()
         messages = [message]
+        history = self.current_state.get("messages")       # Historial previo a la pregunta (se lee una sola vez)
+
+        # Las respuestas anticipadas solo valen para la pregunta que sigue a la respuesta con la que se prepararon
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None:
+            answer_id, store = prefetched
+            answer = store.lookup(question) if history and history[-1].id == answer_id else None
+            if answer is not None:
+                return self.__replay(message, answer, sync, history)
+
+        # La caché se indexa solo por el texto de la pregunta, así que solo vale sin contexto previo
+        cacheable = self.cache is not None and not history
+        if cacheable:
+            answer = self.cache.lookup(question)
+            if answer is not None:
+                return self.__replay(message, answer, sync, history)
+
         if sync:
-            return self.__invoke(messages)
+            answer = self.__invoke(messages)
+        elif loop is not None:
+            answer = loop.run_until_complete(self.__ainvoke(messages))
         else:
-            return asyncio.run(self.__ainvoke(messages))
+            answer = asyncio.run(self.__ainvoke(messages))
 
-    def __invoke(self, messages: list[AnyMessage]) -> AnyMessage:
-        """Formula una pregunta al agente y devuelve la última respuesta.
+        if cacheable and answer is not None:
+            # Guardar la respuesta carga el modelo de embeddings la primera vez (y puede descargarlo):
+            # si falla, se pierde la entrada de la caché, pero no la respuesta
+            try:
+                self.cache.store(question, answer)
+            except Exception:
+                logger.warning("No se pudo guardar la respuesta en la caché semántica", exc_info=True)
+        return answer
+
+    def __invoke(self, messages: list[AnyMessage]) -> AnyMessage|None:
+        """Ejecuta el grafo de forma síncrona y devuelve la última respuesta.
 
         Parámetros:
-            question: texto de la consulta del usuario.
+            messages: mensajes de entrada para el grafo.
         """
-        return self.graph.invoke(input={"messages": messages}, config=self.config)
+        state = self.graph.invoke(input={"messages": messages}, config=self.config)
+        return state["messages"][-1] if state["messages"] else None
 
-    async def __ainvoke(self, messages: list[AnyMessage]) -> None:
-        """Formula una pregunta al agente y devuelve la última respuesta.
+    async def __ainvoke(self, messages: list[AnyMessage]) -> AnyMessage|None:
+        """Ejecuta el grafo imprimiendo la respuesta a medida que se genera y devuelve la última respuesta.
 
         Parámetros:
-            question: texto de la consulta del usuario.
+            messages: mensajes de entrada para el grafo.
         """
-        print(f"\n{bold('🤖 Wiseguy:', PURPLE)} ", end="")
+        # Los tokens llegan de pocos caracteres en pocos caracteres: se escriben en el buffer de
+        # stdout y se vuelca como mucho cada STREAM_FLUSH_INTERVAL segundos
+        write = sys.stdout.write
+        flush = sys.stdout.flush
+        write(f"\n{bold('🤖 Wiseguy:', PURPLE)} ")
+        flush()
+        last_flush = time.monotonic()
+        answer = None
         async for event in self.graph.astream_events(input={"messages": messages}, config=self.config):
             kind = event["event"]
-            if kind == "on_chat_model_stream":
+            if kind == "on_chain_end" and not event["parent_ids"]:
+                # Fin de la ejecución del grafo (el único evento sin padre): su salida es el estado final
+                state_messages = event["data"]["output"]["messages"]
+                answer = state_messages[-1] if state_messages else None
+            elif kind == "on_chat_model_stream":
                 content = event["data"]["chunk"].content
                 # Si el contenido está vacío significa que el modelo está pidiendo una herramienta, por eso sólo imprimimos contenido no vacío
                 if content:
-                    print(content, end="")
+                    write(content)
+                    now = time.monotonic()
+                    if now - last_flush > STREAM_FLUSH_INTERVAL:
+                        flush()
+                        last_flush = now
+        flush()
+        return answer
+
+    def __replay(self, message: HumanMessage, answer: AnyMessage, sync: bool, history: list[AnyMessage]|None) -> AnyMessage:
+        """Devuelve una respuesta obtenida de la caché como si la hubiera generado el grafo.
+
+        La pregunta y la respuesta se añaden al hilo de conversación para que las siguientes
+        preguntas mantengan el contexto.
+
+        Parámetros:
+            message: mensaje con la pregunta del usuario.
+            answer: respuesta almacenada en la caché.
+            sync: si es ``False``, imprime la respuesta igual que en modo streaming.
+            history: historial de la conversación antes de la pregunta.
+        """
+        messages = [message, answer]
+        if self.system and not history:
+            # El nodo "init" no se ejecuta, así que el mensaje de sistema se añade aquí
+            messages.insert(0, SystemMessage(content=self.system))
+        self.graph.update_state(self.config, {"messages": messages}, as_node="llm")
+        if self.verbose:
+            answer.pretty_print()
+        if not sync:
+            print(f"\n{bold('🤖 Wiseguy:', PURPLE)} {answer.content}", end="")
+        return answer
+
+    async def prefetch(self, answer: AnyMessage|None, n: int = 3) -> None:
+        """Anticipa las respuestas a posibles preguntas de seguimiento.
+
+        Está pensado para ejecutarse como tarea en segundo plano mientras el usuario escribe
+        la siguiente pregunta, y para cancelarse en cuanto la envía. Si la pregunta real es
+        equivalente a una de las anticipadas, ``ask`` devuelve esa respuesta sin ejecutar el grafo.
+        Las respuestas dependen del contexto, así que se guardan aparte de la caché semántica y
+        se descartan en la siguiente llamada a ``ask``, tanto si se usan como si no.
+
+        Parámetros:
+            answer: última respuesta del agente.
+            n: número de preguntas de seguimiento a anticipar.
+        """
+        if self.prefetch_model is None or answer is None:
+            return
+        store = SemanticCache()
+        self._prefetched = (answer.id, store)
+        response = await self.prefetch_model.ainvoke([
+            SystemMessage(content=FOLLOW_UP_PROMPT.format(n=n)),
+            HumanMessage(content=answer.content),
+        ])
+        # Se quita solo el marcador de lista ("-", "1.", "2)"...), no los dígitos que formen parte de la pregunta
+        questions = [q for q in (_LIST_MARKER.sub("", line).strip() for line in response.content.splitlines()) if q]
+        state = self.current_state                          # Todas las preguntas parten del mismo estado, que se lee una sola vez
+        await asyncio.gather(*(self.__prefetch_one(q, state, store) for q in questions[:n]))
+
+    async def __prefetch_one(self, question: str, state: AgentState, store: SemanticCache) -> None:
+        """Responde a una pregunta anticipada y guarda la respuesta en ``store``.
+
+        La pregunta se responde en un hilo de conversación aparte que parte de la conversación
+        actual, de modo que el historial del usuario no se modifica.
+
+        Parámetros:
+            question: pregunta de seguimiento anticipada.
+            state: estado actual de la conversación, del que parte el hilo aparte.
+            store: almacén de las respuestas anticipadas para la próxima pregunta.
+        """
+        thread_id = uuid.uuid4().hex
+        config = {**self.config, "configurable": {**self.config["configurable"], "thread_id": thread_id}}
+        try:
+            await self.graph.aupdate_state(config, state, as_node="llm")
+            result = await self.graph.ainvoke(input={"messages": [HumanMessage(content=question)]}, config=config)
+            store.store(question, result["messages"][-1])
+        finally:
+            _CHECKPOINTER.delete_thread(thread_id)
 
     def print_graph(self) -> None:
         """Imprime una representación del grafo del agente."""
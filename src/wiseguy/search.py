@@ -0,0 +1,52 @@
+import asyncio
+import atexit
+
+import requests
+from langchain_tavily import _utilities
+from requests.adapters import HTTPAdapter
+
+# Sesión HTTP compartida por todas las búsquedas: mantiene abiertas las conexiones (TCP + TLS) entre llamadas
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=16))
+atexit.register(_SESSION.close)
+
+
+class _PooledRequests:
+    """Sustituye al módulo ``requests`` dentro de langchain-tavily.
+
+    ``post`` se envía a través de la sesión compartida; el resto de atributos (excepciones,
+    ``get``...) se delega en el propio ``requests``. Solo cambia el transporte: la construcción
+    de la petición y el tratamiento de la respuesta siguen siendo los de langchain-tavily.
+    """
+
+    post = staticmethod(_SESSION.post)
+
+    def __getattr__(self, name: str):
+        return getattr(requests, name)
+
+
+# langchain-tavily llama a ``requests.post`` en cada búsqueda, que abre y cierra una sesión (y su conexión) cada vez
+_utilities.requests = _PooledRequests()
+
+
+class PooledTavilySearchAPIWrapper(_utilities.TavilySearchAPIWrapper):
+    """Cliente de la API de búsqueda de Tavily que reutiliza las conexiones HTTP.
+
+    ``TavilySearchAPIWrapper`` abre una conexión nueva en cada búsqueda (``requests.post`` en
+    la versión síncrona y una ``aiohttp.ClientSession`` nueva en la asíncrona), de modo que
+    cada llamada vuelve a pagar el handshake TLS. Al importar este módulo, las peticiones
+    síncronas de langchain-tavily pasan a usar una ``requests.Session`` compartida, y esta
+    clase resuelve también las asíncronas por esa vía.
+
+    Se usa como ``api_wrapper`` de ``TavilySearch``::
+
+        TavilySearch(max_results=4, api_wrapper=PooledTavilySearchAPIWrapper())
+    """
+
+    async def raw_results_async(self, *args, **kwargs) -> dict:
+        """Versión asíncrona de ``raw_results``.
+
+        Se ejecuta en un hilo con la sesión síncrona compartida que, a diferencia de una
+        sesión de ``aiohttp``, no queda ligada a un event loop concreto.
+        """
+        return await asyncio.to_thread(self.raw_results, *args, **kwargs)
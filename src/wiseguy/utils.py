@@ -1,3 +1,5 @@
+import asyncio
+import threading
 
 BLUE = "34"
 PURPLE = "35"
@@ -5,3 +7,25 @@ PURPLE = "35"
 def bold(text: str, color: str = BLUE) -> str:
     """Devuelve el texto formateado en negrita y color para la consola."""
     return f"\033[1m\033[{color}m{text}\033[0m"
+
+
+async def ainput(prompt: str = "") -> str:
+    """Lee una línea de la entrada estándar sin bloquear el event loop.
+
+    ``input`` se ejecuta en un hilo daemon para que las tareas en segundo plano sigan
+    avanzando mientras el usuario escribe, y para no retrasar la salida del programa
+    si se interrumpe con Ctrl+C.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def read():
+        try:
+            line = input(prompt)
+        except Exception as e:
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(future.set_result, line)
+
+    threading.Thread(target=read, daemon=True).start()
+    return await future